@@ -26,6 +26,16 @@ zipfit_pairs={'cer_temp': 'itempfit',
               'thomson_temp': 'etempfit',
               'thomson_density': 'edensfit'}
 
+# for combining DIII-D gas valves into per-gas totals (combined_gas_types)
+# full list of unique valves and gases below
+# {'LOB1', 'PFX2', 'A', 'B', 'PFX1', 'C', 'DRDP', 'LOB2', 'D', 'UOB', 'E', 'CPGAS', 'PFX3'}
+# {'XE', 'He   ', 'CH4', '13CD4', 'D2', 'Xe', 'None ', 'D2   ', 'Ne', 'KR', '5-Xe_95-D2', 'None', 'H2   ', 'Ne   ', 'Tokamakium', 'Ar   ', ' ', 'AR/N2', 'Ar', 'NE', 'He', 'N2', 'He3', 'HE', 'AR', '10-Kr_90-D2', 'H2', 'CH4  '}
+# could use regex if necessary, instead just strip and upper ( print(re.search(r'^D2?$', 'D2')) )
+valve_mapping={'gasA': 'A', 'gasB': 'B', 'gasC': 'C', 'gasD': 'D', 'gasE': 'E',
+               'pfx1': 'PFX1', 'pfx2': 'PFX2', 'pfx3': 'PFX3', 'uob': 'UOB'}
+gas_mapping={'D2': 'D_tot', 'N2': 'N_tot', 'H2': 'H_tot',
+             'HE': 'He_tot', 'NE': 'Ne_tot', 'AR': 'Ar_tot'}
+
 # our PCS algo stuff
 etemp_sigs=['etstein', 'etsnein','etscrin', 'etsctin','etsinq', 'etsinprs',
           'etsteout', 'etsneout', 'etsqout', 'etsprsout',
@@ -7,8 +7,6 @@ import os
 from splines.pcs_fit_helpers import calculate_mhat, spline_eval
 from mtanh_mpfit.mtanh_driver import mtanh_eval
 
-from transport_helpers import my_interp
-
 def linear_interp_1d(in_x, in_t, value, uncertainty, out_x):
     final_sig=[]
 
@@ -18,11 +16,12 @@ def linear_interp_1d(in_x, in_t, value, uncertainty, out_x):
         x=in_x[time_ind,~excluded_inds]
         err=uncertainty[time_ind,~excluded_inds]
 
-        try:
-            get_value=my_interp(x,y,kind='linear')
-            final_sig.append(get_value(out_x))
-        except:
+        # np.interp clamps to the end values like my_interp did, but needs sorted x
+        if len(x)<2:
             final_sig.append(np.zeros(len(out_x)))
+            continue
+        inds=np.argsort(x)
+        final_sig.append(np.interp(out_x,x[inds],y[inds]))
 
     final_sig=np.array(final_sig)
     return final_sig
@@ -83,8 +82,7 @@ def pcs_spline_1d(in_x, in_t, value, uncertainty, out_x):
         mPsi=mPsi[:-1] # still not sure why the last index is always 0, should talk to ricardo (TODO)
         mHat=mHat[:-1]
         splined_rot=spline_eval(mPsi,mHat,len(mHat))
-        get_rot=my_interp(np.linspace(0,1.2,121),splined_rot,kind='linear')
-        final_sig.append(get_rot(out_x))
+        final_sig.append(np.interp(out_x,np.linspace(0,1.2,121),splined_rot))
 
     final_sig=np.array(final_sig)
     return final_sig
@@ -98,8 +96,8 @@ def pcs_mtanh_1d(in_x, in_t, value, uncertainty, out_x):
         x=in_x[time_ind,~excluded_inds]
         err=uncertainty[time_ind,~excluded_inds]
         (mtanh_psi,mtanh_signal)=mtanh_eval(x,y,err)
-        get_signal=my_interp(mtanh_psi,mtanh_signal,kind='linear')
-        final_sig.append(get_signal(out_x))
+        inds=np.argsort(mtanh_psi)
+        final_sig.append(np.interp(out_x,mtanh_psi[inds],mtanh_signal[inds]))
 
     final_sig=np.array(final_sig)
     return final_sig
@@ -165,6 +163,16 @@ def linear_interp_2d(in_x, in_t, value, uncertainty, out_x, out_t):
     # return fit_rbf(in_x, in_t, value, uncertainty, out_x, out_t)
 
 
+# rbf_interp_2d runs on GPU if pytorch and torchrbf (pip install torchrbf) are
+# installed and a GPU is visible, otherwise it falls back to scipy on CPU
+def gpu_rbf_available():
+    try:
+        import torch
+        import torchrbf
+    except ImportError:
+        return False
+    return torch.cuda.is_available()
+
 def rbf_interp_2d(in_x, in_t, value, uncertainty, out_x, out_t, debug=False):
     final_sig=[]
 
@@ -189,10 +197,20 @@ def rbf_interp_2d(in_x, in_t, value, uncertainty, out_x, out_t, debug=False):
     x_scaled=scale(x,[0,1]) #out_x)
     out_x_scaled=scale(out_x,[0,1]) #out_x)
     
-    get_value=interpolate.Rbf(t_scaled,x_scaled,y, function='Gaussian', epsilon=.1) #,metric='seuclidean')
     import itertools
     coords=np.array(list(itertools.product(out_t_scaled,out_x_scaled))).T
-    final_sig=get_value(coords[0],coords[1])
+    if gpu_rbf_available():
+        import torch
+        from torchrbf import RBFInterpolator
+        # torchrbf follows scipy's RBFInterpolator: gaussian is exp(-(epsilon*r)^2) rather
+        # than Rbf's exp(-(r/epsilon)^2), and degree=-1 drops the polynomial Rbf doesn't have
+        get_value=RBFInterpolator(torch.as_tensor(np.stack((t_scaled,x_scaled)).T,device='cuda'),
+                                  torch.as_tensor(y[:,np.newaxis],device='cuda'),
+                                  kernel='gaussian', epsilon=1/.1, degree=-1, device='cuda')
+        final_sig=get_value(torch.as_tensor(coords.T,device='cuda')).cpu().numpy()[:,0]
+    else:
+        get_value=interpolate.Rbf(t_scaled,x_scaled,y, function='Gaussian', epsilon=.1) #,metric='seuclidean')
+        final_sig=get_value(coords[0],coords[1])
     final_sig=final_sig.reshape((len(out_t_scaled),len(out_x_scaled)))
 
     return final_sig
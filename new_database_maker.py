@@ -39,10 +39,11 @@ import h5py
 import matplotlib.pyplot as plt
 import numpy as np
 import yaml
-from scipy import interpolate, stats
 from toksearch import MdsSignal, Pipeline, PtDataSignal
 from toksearch.sql.mssql import connect_d3drdb
-from transport_helpers import Timer, my_interp, standardize_time
+from transport_helpers import (Timer, get_mode, interp_rows, interp_weights,
+                               psirz_interpolator, stack_time_traces,
+                               standardize_time)
 
 parser = argparse.ArgumentParser(description='Read tokamak data via toksearch.')
 parser.add_argument('config_filename', type=str,
@@ -53,12 +54,10 @@ with open(args.config_filename,"r") as f:
     cfg=yaml.safe_load(f)
 
 from database_settings import (cer_areas, cer_channels_all,
-                               cer_channels_realtime, cer_scale,
+                               cer_channels_realtime, cer_scale, gas_mapping,
                                modal_sig_names, pcs_length, thomson_mds_areas,
-                               thomson_mds_scale, thomson_pcs_area_mapping,
-                               thomson_pcs_areas, thomson_pcs_max_channels,
-                               thomson_pcs_scale, thomson_pcs_signal_mapping,
-                               zipfit_pairs)
+                               thomson_mds_scale, thomson_pcs_areas,
+                               thomson_pcs_scale, valve_mapping, zipfit_pairs)
 
 if cfg['data']['include_rt_thomson']:
     thomson_areas=thomson_pcs_areas
@@ -108,20 +107,39 @@ for trial_fit in cfg['data']['trial_fits']:
 needed_sigs+=['zipfit_{}_rho'.format(sig_name) for sig_name in cfg['data']['zipfit_sig_names']]
 needed_sigs+=['zipfit_{}_psi'.format(sig_name) for sig_name in cfg['data']['zipfit_sig_names']]
 
+# signals change_timebase tries to put on the standard timebase; AOT profiles
+# are (space, time) and get their own treatment in add_aot_profs
+timebase_sigs=tuple(sig_name for sig_name in needed_sigs
+                    if sig_name not in cfg['data']['aot_prof_sig_names'])
+# of those, the ones whose raw fetch is read again by a later map stage
+reread_sigs=set(cfg['data']['pcs_sig_names'])|{'psirz','rhovn'}
+# how each signal gets averaged onto the standard timebase
+smoothing_fxns={sig_name: (get_mode if sig_name.casefold() in modal_sig_names else np.mean)
+                for sig_name in needed_sigs}
+# thomson/CER profiles only carry a few significant digits, so their
+# per-channel (time, channel) arrays are kept in single precision
+raw_1d_dtype=np.float32
+# rho grid of the AOT profiles, the same for every shot
+aot_prof_rho=np.linspace(0,1,201)
+
 ##########################
 
 if cfg['logistics']['num_processes']>1:
     os.environ["MKL_NUM_THREADS"] = "1"
     os.environ["NUMEXPR_NUM_THREADS"] = "1"
     os.environ["OMP_NUM_THREADS"] = "1"
+    # numba's prange kernels in transport_helpers ignore the OMP/MKL settings;
+    # read when numba is imported, so this covers the Ray workers
+    os.environ["NUMBA_NUM_THREADS"] = "1"
 
 # first_shot_of_year=[0,    140838,143703,148158,152159,156197,160938,164773,168439,174574,177976,181675,183948,200000]
 # campaign_names=    ['old','2010','2011','2012','2013','2014','2015','2016','2017','2018','2019','2020','2021']
 if isinstance(cfg['data']['shots'],str):
-    all_shots=np.load(cfg['data']['shots'])
+    all_shots=np.load(cfg['data']['shots'],mmap_mode='r')
 else:
-    all_shots=cfg['data']['shots']
-all_shots=sorted(all_shots,reverse=True)
+    all_shots=np.asarray(cfg['data']['shots'])
+# newest shot first
+all_shots=np.sort(all_shots)[::-1]
 
 # psi / rho
 standard_x=np.linspace(0,1,cfg['data']['num_x_points'])
@@ -141,19 +159,122 @@ fit_functions_2d=['nn_interp_2d','linear_interp_2d','rbf_interp_2d']
 
 filename=os.path.expandvars(cfg['logistics']['output_file'])
 
+# map stages drop raw *_full fetches once no later stage reads them, so the
+# remaining stages (the fits especially) run on a smaller record
+def drop_raw_signals(record, keys):
+    for key in keys:
+        if key in record:
+            del record[key]
+
+def compute_records(pipeline):
+    if cfg['logistics']['num_processes']>1:
+        # note use compute_spark for Iris, compute_ray for saga
+        return pipeline.compute_ray(numparts=cfg['logistics']['num_processes'])
+    return pipeline.compute_serial()
+
+# SQL results are fetched and written this many shots at a time, so only
+# one chunk of rows (logbook entries especially) is held in memory at once
+max_shots_per_sql_query=500
+def sql_batches(shots):
+    for i in range(0,len(shots),max_shots_per_sql_query):
+        yield shots[i:i+max_shots_per_sql_query]
+
+# e.g. (200726,200725,200724) for a "WHERE shot in" query
+def sql_in_clause(shots):
+    return '({})'.format(','.join(np.char.mod('%d',np.asarray(shots,dtype=np.int64))))
+
+def write_sql_records(final_data, records, sig_names):
+    for record in records:
+        shot=str(record['shot'])
+        final_data.require_group(shot)
+        for sig in sig_names:
+            sig_name=sig+'_sql'
+            # if we get None it throws an error...
+            if record[sig]==None:
+                final_data[shot][sig_name]=np.nan
+            # primarily for dealing with time_of_shot in summaries table;
+            # fixed-length 'YYYY-MM-DD HH:MM:SS' avoids a variable-length string
+            elif isinstance(record[sig],datetime.datetime):
+                final_data[shot][sig_name]=np.bytes_(record[sig].strftime('%Y-%m-%d %H:%M:%S'))
+            else:
+                final_data[shot][sig_name]=record[sig]
+
+# numeric arrays bigger than this get chunked and LZF-compressed on disk,
+# anything smaller (scalars, short lists, strings) is stored as is
+compression_min_bytes=4096
+# ~1 MB chunks of float64 along time for 1D signals
+max_chunk_length=131072
+def write_dataset(group, name, data):
+    # rewrite an existing dataset in place if the new data fits it, otherwise replace it
+    if name in group:
+        dataset=group[name]
+        if isinstance(dataset,h5py.Dataset) and dataset.shape==np.shape(data) \
+           and dataset.dtype==np.asarray(data).dtype:
+            dataset[()]=data
+            return
+        del group[name]
+    if isinstance(data,np.ndarray) and data.dtype.kind in 'fiu' and data.nbytes>compression_min_bytes:
+        if data.ndim==1:
+            chunks=(min(len(data),max_chunk_length),)
+        else:
+            chunks=True
+        group.create_dataset(name,data=data,chunks=chunks,
+                             compression='lzf',shuffle=True)
+    else:
+        group[name]=data
+
+# for tables with several rows per shot (gas valves, logbook entries),
+# each signal is saved as the list of its values over the shot's rows
+def write_sql_lists(final_data, records, shots, sig_names):
+    # count rows first so each shot's arrays can be allocated at their final size
+    counts=collections.Counter(str(record['shot']) for record in records)
+    # only shots that have rows; the rest get empty datasets below
+    tmp_dic={shot: {sig: np.empty(count,dtype=object) for sig in sig_names}
+             for shot,count in counts.items()}
+    no_rows=np.empty(0,dtype=object)
+    row_inds=collections.defaultdict(int)
+    for record in records:
+        shot=str(record['shot'])
+        row_ind=row_inds[shot]
+        for sig in sig_names:
+            tmp_dic[shot][sig][row_ind]=str(record[sig])
+        row_inds[shot]+=1
+    for shot in shots:
+        shot=str(shot)
+        final_data.require_group(shot)
+        for sig in sig_names:
+            sig_name=sig+'_sql'
+            data=tmp_dic[shot][sig] if shot in tmp_dic else no_rows
+            final_data[shot].create_dataset(sig_name,
+                                            data=data,
+                                            dtype=h5py.string_dtype())
+
+# bigger raw-data chunk cache than h5py's 1 MB default, and the newer file format;
+# the slot count stays at the default since HDF5 allocates it for every chunked dataset
+def open_output_file(filename):
+    return h5py.File(filename,'a',libver='latest',rdcc_nbytes=64*1024*1024)
+
+# both axes are evenly spaced, so matching shape, dtype and endpoints is enough;
+# only read the whole axis from disk if one of those differs
+def same_axis(dataset, axis):
+    if dataset.shape==axis.shape and dataset.dtype==axis.dtype and \
+       (len(axis)==0 or (dataset[0]==axis[0] and dataset[-1]==axis[-1])):
+        return True
+    return np.array_equal(dataset[()],axis)
+
 standard_times=np.arange(cfg['data']['tmin'],cfg['data']['tmax'],cfg['data']['time_step'])
-with h5py.File(filename,'a') as final_data:
+with open_output_file(filename) as final_data:
     if 'times' in final_data:
-        assert np.all(final_data['times']==standard_times), f"Time in existing h5 file {filename} different from the one you attempt to read (based on config file's tmin, tmax, time_step)"
+        assert same_axis(final_data['times'],standard_times), f"Time in existing h5 file {filename} different from the one you attempt to read (based on config file's tmin, tmax, time_step)"
     else:
         final_data['times']=standard_times
     if 'spatial_coordinates' in final_data:
-        assert np.all(final_data['spatial_coordinates']==standard_x), f"Time in existing h5 file {filename} different from the one you attempt to read (based on config file's tmin, tmax, time_step)"
+        assert same_axis(final_data['spatial_coordinates'],standard_x), f"Spatial coordinates in existing h5 file {filename} different from the one you attempt to read (based on config file's num_x_points)"
     else:
         final_data['spatial_coordinates']=standard_x
 
 if cfg['logistics']['overwrite_shots']:
-    with h5py.File(filename,'a') as final_data:
+    with open_output_file(filename) as final_data:
         for shot in all_shots:
             if str(shot) in final_data:
                 del final_data[str(shot)]
@@ -168,345 +289,278 @@ for i in range(num_files):
     subshots.append(all_shots[i*cfg['logistics']['max_shots_per_run']:min((i+1)*cfg['logistics']['max_shots_per_run'],
                                                                            len(all_shots))])
 
-for which_shot,shots in enumerate(subshots):
-    print(f'Starting shot {shots[0]}-{shots[-1]}')
-    sys.stdout.flush()
-
-    print('Writing summary SQL signals')
-    # pipeline for SQL signals
-    if len(cfg['data']['sql_sig_names'])>0:
-        conn = connect_d3drdb()
-        # you can continue adding joins to make sure all signals get collected
-        query="""SELECT summaries.shot,{}
-                 FROM summaries
-                 INNER JOIN shots ON summaries.shot=shots.shot
-                 WHERE summaries.shot in {}
-              """.format(
-            ','.join(cfg['data']['sql_sig_names']),
-            '({})'.format(','.join([str(elem) for elem in shots]))
-            )
-        pipeline = Pipeline.from_sql(conn, query)
-        records=pipeline.compute_serial()
-        with h5py.File(filename,'a') as final_data:
-            for record in records:
-                shot=str(record['shot'])
-                final_data.require_group(shot)
-                for sig in cfg['data']['sql_sig_names']:
-                    sig_name=sig+'_sql'
-                    # if we get None it throws an error...
-                    if record[sig]==None:
-                        final_data[shot][sig_name]=np.nan
-                    # primarily for dealing with time_of_shot in summaries table
-                    elif isinstance(record[sig],datetime.datetime):
-                        final_data[shot][sig_name]=str(record[sig])
-                    else:
-                        final_data[shot][sig_name]=record[sig]
-
-    print('Writing gas SQL signals')
-    # pipeline for GAS
-    if cfg['data']['include_gas_valve_info']:
-        gas_sigs=['gas','valve']
-        conn = connect_d3drdb()
-        # you can continue adding joins to make sure all signals get collected
-        query="""SELECT shot,{}
-                 FROM gasvalves
-                 WHERE shot in {}
-              """.format(
-            ','.join(gas_sigs),
-            '({})'.format(','.join([str(elem) for elem in shots]))
-            )
-        pipeline = Pipeline.from_sql(conn, query)
-        records=pipeline.compute_serial()
-        tmp_dic={str(shot): {sig: [] for sig in gas_sigs} for shot in shots}
-        for record in records:
-            for sig in gas_sigs:
-                shot=str(record['shot'])
-                tmp_dic[shot][sig].append(str(record[sig]))
-        with h5py.File(filename,'a') as final_data:
-            for shot in tmp_dic:
-                final_data.require_group(shot)
-                for sig in gas_sigs:
-                    sig_name=sig+'_sql'
-                    final_data[shot][sig_name]=tmp_dic[shot][sig]
-
-    print('Writing log SQL signals')
-    # pipeline for LOGS
-    if cfg['data']['include_log_info']:
-        log_sigs=['text','topic','username']
-        conn = connect_d3drdb()
-        query="""SELECT shot,{}
-                 FROM entries
-                 WHERE shot in {}
-              """.format(
-            ','.join(log_sigs),
-            '({})'.format(','.join([str(elem) for elem in shots]))
-            )
-        pipeline = Pipeline.from_sql(conn, query)
-        records=pipeline.compute_serial()
-        tmp_dic={str(shot): {sig: [] for sig in log_sigs} for shot in shots}
-        for record in records:
-            for sig in log_sigs:
-                shot=str(record['shot'])
-                tmp_dic[shot][sig].append(str(record[sig]))
-        with h5py.File(filename,'a') as final_data:
-            for shot in tmp_dic:
-                final_data.require_group(shot)
-                for sig in log_sigs:
-                    sig_name=sig+'_sql'
-                    final_data[shot][sig_name]=tmp_dic[shot][sig]
-
-    print('Gathering timebased signals')
-    # pipeline for regular signals
-    pipeline = Pipeline(shots)
-
-    ######## FETCH SCALARS #############
-    for sig_name in cfg['data']['scalar_sig_names']:
-        signal=PtDataSignal(sig_name)
-        pipeline.fetch('{}_full'.format(sig_name),signal)
-
-    ######## FETCH STABILITY #############
-    for sig_name in cfg['data']['stability_sig_names']:
-        signal=MdsSignal('.MIRNOV.{}'.format(sig_name),
-                         'MHD',
-                         location='remote://atlas.gat.com')
-        pipeline.fetch('{}_full'.format(sig_name),signal)
-
-    ######## FETCH SCALARS #############
-    for sig_name in cfg['data']['nb_sig_names']:
-        signal=MdsSignal(sig_name,
-                         'NB',
-                         location='remote://atlas.gat.com')
-        pipeline.fetch('{}_full'.format(sig_name),signal)
-
+# toksearch signals only describe where to find the data, not which shot, so
+# build them once here and attach them to each batch's pipeline below
+signals=[]
+
+######## FETCH SCALARS #############
+for sig_name in cfg['data']['scalar_sig_names']:
+    signal=PtDataSignal(sig_name)
+    signals.append(('{}_full'.format(sig_name),signal))
+
+######## FETCH STABILITY #############
+for sig_name in cfg['data']['stability_sig_names']:
+    signal=MdsSignal('.MIRNOV.{}'.format(sig_name),
+                     'MHD',
+                     location='remote://atlas.gat.com')
+    signals.append(('{}_full'.format(sig_name),signal))
+
+######## FETCH SCALARS #############
+for sig_name in cfg['data']['nb_sig_names']:
+    signal=MdsSignal(sig_name,
+                     'NB',
+                     location='remote://atlas.gat.com')
+    signals.append(('{}_full'.format(sig_name),signal))
+
+######## FETCH EFIT PROFILES #############
+for efit_type in cfg['data']['efit_types']:
+    for sig_name in cfg['data']['efit_profile_sig_names']:
+        signal=MdsSignal('RESULTS.GEQDSK.{}'.format(sig_name),
+                         efit_type,
+                         location='remote://atlas.gat.com',
+                         dims=['psi','times'])
+        signals.append(('{}_{}_full'.format(sig_name,efit_type),
+                        signal))
     ######## FETCH EFIT PROFILES #############
-    for efit_type in cfg['data']['efit_types']:
-        for sig_name in cfg['data']['efit_profile_sig_names']:
-            signal=MdsSignal('RESULTS.GEQDSK.{}'.format(sig_name),
-                             efit_type,
-                             location='remote://atlas.gat.com',
-                             dims=['psi','times'])
-            pipeline.fetch('{}_{}_full'.format(sig_name,efit_type),
-                           signal)
-        ######## FETCH EFIT PROFILES #############
-        for sig_name in cfg['data']['efit_scalar_sig_names'] :
-            signal=MdsSignal(r'\{}'.format(sig_name.upper()),
-                             efit_type,
-                             location='remote://atlas.gat.com')
-            pipeline.fetch('{}_{}_full'.format(sig_name,efit_type),
-                           signal)
-
-    ######## FETCH AOT SCALARS #############
-    for sig_name in cfg['data']['aot_scalar_sig_names'] :
-        signal=MdsSignal('{}'.format(sig_name.upper()),
-                         'AOT',
+    for sig_name in cfg['data']['efit_scalar_sig_names'] :
+        signal=MdsSignal(r'\{}'.format(sig_name.upper()),
+                         efit_type,
                          location='remote://atlas.gat.com')
-        pipeline.fetch('{}_full'.format(sig_name),
-                       signal)
-
-    ######## FETCH AOT PROFILES ###########
-    for sig_name in cfg['data']['aot_prof_sig_names']:
-        signal=MdsSignal('{}'.format(sig_name.upper()),
-                         'AOT',
-                         location='remote://atlas.gat.com')
-        pipeline.fetch('{}_full'.format(sig_name),
-                       signal)
-
-    ######## FETCH CALIBRATED GAS ############
-    for sig_name in cfg['data']['gas_cal_sig_names'] :
-        signal=MdsSignal(f'.GASFLOW.{sig_name}.FLOW',
-                         'NEUTRALS')
-        pipeline.fetch(f'{sig_name}_full',
-                       signal)
-
-    ######## FETCH PSIRZ (FIRST EFIT ONLY)  #############
-    if cfg['data']['include_psirz'] or psirz_needed:
-        psirz_sig = MdsSignal(r'\psirz',
-                              cfg['data']['efit_types'][0],
-                              location='remote://atlas.gat.com',
-                              dims=['r','z','times'])
-        pipeline.fetch('psirz_full',psirz_sig)
-        ssimag_sig = MdsSignal(r'\ssimag',
-                              cfg['data']['efit_types'][0],
-                              location='remote://atlas.gat.com')
-        pipeline.fetch('ssimag_full',ssimag_sig)
-        ssibry_sig = MdsSignal(r'\ssibry',
-                              cfg['data']['efit_types'][0],
-                              location='remote://atlas.gat.com')
-        pipeline.fetch('ssibry_full',ssibry_sig)
-
-    ######## FETCH RHOVN (FIRST EFIT ONLY) ###############
-    if cfg['data']['include_rhovn'] or len(cfg['data']['zipfit_sig_names'])>0:
-        rhovn_sig = MdsSignal(r'\rhovn',
-                              cfg['data']['efit_types'][0],
-                              location='remote://atlas.gat.com',
-                              dims=['psi','times'])
-        pipeline.fetch('rhovn_full',rhovn_sig)
-    ######## FETCH THOMSON #############
-    for sig_name in cfg['data']['thomson_sig_names']:
-        for thomson_area in thomson_areas:
-            thomson_sig = MdsSignal(r'TS.BLESSED.{}.{}'.format(thomson_area,sig_name),
-                                    'ELECTRONS',
-                                    location='remote://atlas.gat.com',
-                                    dims=('times','position'))
-            pipeline.fetch('thomson_{}_{}_full'.format(thomson_area,sig_name),thomson_sig)
-            if cfg['data']['include_thomson_uncertainty']:
-                thomson_error_sig = MdsSignal(r'TS.BLESSED.{}.{}_E'.format(thomson_area,sig_name),
-                                              'ELECTRONS',
-                                              location='remote://atlas.gat.com')
-                pipeline.fetch('thomson_{}_{}_uncertainty_full'.format(thomson_area,sig_name),thomson_error_sig)
-            if cfg['data']['include_rt_thomson']:
-                for channel in thomson_pcs_max_channels[thomson_area]:
-                    thomson_sig = PtDataSignal('tss{}{}{:02d}'.format(thomson_pcs_area_mapping[thomson_area],
-                                                                               thomson_pcs_signal_mapping[sig_name],
-                                                                               channel))
-                    pipeline.fetch(f'thomson_rt_{thomson_area}_{sig_name}_{channel}_full', thomson_sig)
-                    # if cfg['data']['include_thomson_uncertainty']:
-                    #     thomson_sig = PtDataSignal('tss{}{}{:02d}'.format(thomson_pcs_area_mapping[thomson_area],
-                    #                                                                thomson_pcs_signal_mapping[sig_name],
-                    #                                                                channel))
-                    #     pipeline.fetch(f'thomson_rt_{thomson_area}_{sig_name}_{channel}_uncertainty_full', thomson_sig)
-
-    ######## FETCH CER     #############
-    if len(cfg['data']['cer_sig_names'])>0:
-        if cfg['data']['cer_realtime_channels']:
-            cer_channels=cer_channels_realtime
-        else:
-            cer_channels=cer_channels_all
-        for cer_area in cer_areas:
-            for channel in cer_channels[cer_area]:
-                cer_R_sig = MdsSignal('CER.{}.{}.CHANNEL{:02d}.R'.format(cfg['data']['cer_type'],
-                                                                         cer_area,
-                                                                         channel),
-                                      'IONS',
-                                      location='remote://atlas.gat.com')
-                pipeline.fetch('cer_{}_{}_R_full'.format(cer_area,channel),cer_R_sig)
-                cer_Z_sig = MdsSignal('CER.{}.{}.CHANNEL{:02d}.Z'.format(cfg['data']['cer_type'],
-                                                                         cer_area,
-                                                                         channel),
-                                      'IONS',
-                                      location='remote://atlas.gat.com')
-                pipeline.fetch('cer_{}_{}_Z_full'.format(cer_area,channel),cer_Z_sig)
-
-                for sig_name in cfg['data']['cer_sig_names']:
-                    correction=''
-                    if sig_name=='rot':
-                        correction='c'
-                    cer_sig = MdsSignal('CER.{}.{}.CHANNEL{:02d}.{}'.format(cfg['data']['cer_type'],
-                                                                            cer_area,
-                                                                            channel,
-                                                                            sig_name+correction),
-                                        'IONS',
-                                        location='remote://atlas.gat.com')
-                    pipeline.fetch('cer_{}_{}_{}_full'.format(cer_area,sig_name,channel),cer_sig)
-                    cer_error_sig = MdsSignal('CER.{}.{}.CHANNEL{:02d}.{}_ERR'.format(cfg['data']['cer_type'],
-                                                                                      cer_area,
-                                                                                      channel,
-                                                                                      sig_name),
-                                              'IONS',
-                                              location='remote://atlas.gat.com')
-                    pipeline.fetch('cer_{}_{}_{}_error_full'.format(cer_area,sig_name,channel),cer_error_sig)
-
-
-    ######## FETCH ZIPFIT ##############
-    for sig_name in cfg['data']['zipfit_sig_names']:
-        zipfit_sig = MdsSignal(r'\ZIPFIT01::TOP.PROFILES.{}'.format(sig_name),'ZIPFIT01',location='remote://atlas.gat.com',dims=['rhon','times'])
-        pipeline.fetch('zipfit_{}_full'.format(sig_name),zipfit_sig)
-
-    ######## FETCH OUR PCS ALGO STUFF #############
-    for sig_name in cfg['data']['pcs_sig_names']:
-       pcs_sig=PtDataSignal(sig_name)
-       pipeline.fetch('{}_full'.format(sig_name),pcs_sig)
-       
-    ######## FETCH BOLOMETRY STUFF #############
-    if cfg['data']['include_radiation']:
-        for i in range(1,25):
-            for position in ['L','U']:
-                radiation_sig=MdsSignal(f'\\SPECTROSCOPY::TOP.PRAD.BOLOM.PRAD_01.POWER.BOL_{position}{i:02d}_P',
-                                        'SPECTROSCOPY',
-                                        location='remote://atlas.gat.com')
-                pipeline.fetch(f'prad{position}{i}_full',radiation_sig)
-        for key in ['KAPPA','PRAD_DIVL','PRAD_DIVU','PRAD_TOT']:
-            radiation_sig=MdsSignal(f'\\SPECTROSCOPY::TOP.PRAD.BOLOM.PRAD_01.PRAD.{key}',
+        signals.append(('{}_{}_full'.format(sig_name,efit_type),
+                        signal))
+
+######## FETCH AOT SCALARS #############
+for sig_name in cfg['data']['aot_scalar_sig_names'] :
+    signal=MdsSignal('{}'.format(sig_name.upper()),
+                     'AOT',
+                     location='remote://atlas.gat.com')
+    signals.append(('{}_full'.format(sig_name),
+                    signal))
+
+######## FETCH AOT PROFILES ###########
+for sig_name in cfg['data']['aot_prof_sig_names']:
+    signal=MdsSignal('{}'.format(sig_name.upper()),
+                     'AOT',
+                     location='remote://atlas.gat.com')
+    signals.append(('{}_full'.format(sig_name),
+                    signal))
+
+######## FETCH CALIBRATED GAS ############
+for sig_name in cfg['data']['gas_cal_sig_names'] :
+    signal=MdsSignal(f'.GASFLOW.{sig_name}.FLOW',
+                     'NEUTRALS')
+    signals.append((f'{sig_name}_full',
+                    signal))
+
+######## FETCH PSIRZ (FIRST EFIT ONLY)  #############
+if cfg['data']['include_psirz'] or psirz_needed:
+    psirz_sig = MdsSignal(r'\psirz',
+                          cfg['data']['efit_types'][0],
+                          location='remote://atlas.gat.com',
+                          dims=['r','z','times'])
+    signals.append(('psirz_full',psirz_sig))
+    ssimag_sig = MdsSignal(r'\ssimag',
+                          cfg['data']['efit_types'][0],
+                          location='remote://atlas.gat.com')
+    signals.append(('ssimag_full',ssimag_sig))
+    ssibry_sig = MdsSignal(r'\ssibry',
+                          cfg['data']['efit_types'][0],
+                          location='remote://atlas.gat.com')
+    signals.append(('ssibry_full',ssibry_sig))
+
+######## FETCH RHOVN (FIRST EFIT ONLY) ###############
+if cfg['data']['include_rhovn'] or len(cfg['data']['zipfit_sig_names'])>0:
+    rhovn_sig = MdsSignal(r'\rhovn',
+                          cfg['data']['efit_types'][0],
+                          location='remote://atlas.gat.com',
+                          dims=['psi','times'])
+    signals.append(('rhovn_full',rhovn_sig))
+######## FETCH THOMSON #############
+for sig_name in cfg['data']['thomson_sig_names']:
+    for thomson_area in thomson_areas:
+        thomson_sig = MdsSignal(r'TS.BLESSED.{}.{}'.format(thomson_area,sig_name),
+                                'ELECTRONS',
+                                location='remote://atlas.gat.com',
+                                dims=('times','position'))
+        signals.append(('thomson_{}_{}_full'.format(thomson_area,sig_name),thomson_sig))
+        if cfg['data']['include_thomson_uncertainty']:
+            thomson_error_sig = MdsSignal(r'TS.BLESSED.{}.{}_E'.format(thomson_area,sig_name),
+                                          'ELECTRONS',
+                                          location='remote://atlas.gat.com')
+            signals.append(('thomson_{}_{}_uncertainty_full'.format(thomson_area,sig_name),thomson_error_sig))
+
+######## FETCH CER     #############
+if len(cfg['data']['cer_sig_names'])>0:
+    if cfg['data']['cer_realtime_channels']:
+        cer_channels=cer_channels_realtime
+    else:
+        cer_channels=cer_channels_all
+    for cer_area in cer_areas:
+        for channel in cer_channels[cer_area]:
+            cer_R_sig = MdsSignal('CER.{}.{}.CHANNEL{:02d}.R'.format(cfg['data']['cer_type'],
+                                                                     cer_area,
+                                                                     channel),
+                                  'IONS',
+                                  location='remote://atlas.gat.com')
+            signals.append(('cer_{}_{}_R_full'.format(cer_area,channel),cer_R_sig))
+            cer_Z_sig = MdsSignal('CER.{}.{}.CHANNEL{:02d}.Z'.format(cfg['data']['cer_type'],
+                                                                     cer_area,
+                                                                     channel),
+                                  'IONS',
+                                  location='remote://atlas.gat.com')
+            signals.append(('cer_{}_{}_Z_full'.format(cer_area,channel),cer_Z_sig))
+
+            for sig_name in cfg['data']['cer_sig_names']:
+                correction=''
+                if sig_name=='rot':
+                    correction='c'
+                cer_sig = MdsSignal('CER.{}.{}.CHANNEL{:02d}.{}'.format(cfg['data']['cer_type'],
+                                                                        cer_area,
+                                                                        channel,
+                                                                        sig_name+correction),
+                                    'IONS',
+                                    location='remote://atlas.gat.com')
+                signals.append(('cer_{}_{}_{}_full'.format(cer_area,sig_name,channel),cer_sig))
+                cer_error_sig = MdsSignal('CER.{}.{}.CHANNEL{:02d}.{}_ERR'.format(cfg['data']['cer_type'],
+                                                                                  cer_area,
+                                                                                  channel,
+                                                                                  sig_name),
+                                          'IONS',
+                                          location='remote://atlas.gat.com')
+                signals.append(('cer_{}_{}_{}_error_full'.format(cer_area,sig_name,channel),cer_error_sig))
+
+
+######## FETCH ZIPFIT ##############
+for sig_name in cfg['data']['zipfit_sig_names']:
+    zipfit_sig = MdsSignal(r'\ZIPFIT01::TOP.PROFILES.{}'.format(sig_name),'ZIPFIT01',location='remote://atlas.gat.com',dims=['rhon','times'])
+    signals.append(('zipfit_{}_full'.format(sig_name),zipfit_sig))
+
+######## FETCH OUR PCS ALGO STUFF #############
+for sig_name in cfg['data']['pcs_sig_names']:
+   pcs_sig=PtDataSignal(sig_name)
+   signals.append(('{}_full'.format(sig_name),pcs_sig))
+   
+######## FETCH BOLOMETRY STUFF #############
+if cfg['data']['include_radiation']:
+    for i in range(1,25):
+        for position in ['L','U']:
+            radiation_sig=MdsSignal(f'\\SPECTROSCOPY::TOP.PRAD.BOLOM.PRAD_01.POWER.BOL_{position}{i:02d}_P',
                                     'SPECTROSCOPY',
                                     location='remote://atlas.gat.com')
-            pipeline.fetch(f'prad{key}_full',radiation_sig)
-
-    ######## ECH DETAILED INFO #########
-    # Note, I'd love to include rho as theoretically AOT does automatically
-    # (see https://diii-d.gat.com/d3d-wiki/images/1/12/Autoonetwo_pointnames_by_function_20150518.pdf)
-    # but it seems for older shots the data isn't available...
-    if cfg['data']['include_full_ech_data']:
-        num_systems=MdsSignal('ECH.NUM_SYSTEMS','RF',dims=())
-        pipeline.fetch('ech_num_systems',num_systems)
-        for i in range(1,7):
-            signal=MdsSignal(f'ECH.SYSTEM_{i}.GYROTRON.NAME','RF',dims=(),
-                             location='remote://atlas.gat.com')
-            pipeline.fetch(f'ech_name_{i}',signal)
-            signal=MdsSignal(f'ECH.SYSTEM_{i}.GYROTRON.FREQUENCY','RF',dims=(),
-                             location='remote://atlas.gat.com')
-            pipeline.fetch(f'ech_frequency_{i}',signal)
-            signal=MdsSignal(f'ECH.SYSTEM_{i}.ANTENNA.LAUNCH_R','RF',dims=(),
-                             location='remote://atlas.gat.com')
-            pipeline.fetch(f'ech_R_{i}',signal)
-            signal=MdsSignal(f'ECH.SYSTEM_{i}.ANTENNA.LAUNCH_Z','RF',dims=(),
-                             location='remote://atlas.gat.com')
-            pipeline.fetch(f'ech_Z_{i}',signal)
-
-        #https://diii-d.gat.com/diii-d/ECHStatus
-        signal=MdsSignal(r'\echpwrc','RF',
+            signals.append((f'prad{position}{i}_full',radiation_sig))
+    for key in ['KAPPA','PRAD_DIVL','PRAD_DIVU','PRAD_TOT']:
+        radiation_sig=MdsSignal(f'\\SPECTROSCOPY::TOP.PRAD.BOLOM.PRAD_01.PRAD.{key}',
+                                'SPECTROSCOPY',
+                                location='remote://atlas.gat.com')
+        signals.append((f'prad{key}_full',radiation_sig))
+
+######## ECH DETAILED INFO #########
+# Note, I'd love to include rho as theoretically AOT does automatically
+# (see https://diii-d.gat.com/d3d-wiki/images/1/12/Autoonetwo_pointnames_by_function_20150518.pdf)
+# but it seems for older shots the data isn't available...
+if cfg['data']['include_full_ech_data']:
+    num_systems=MdsSignal('ECH.NUM_SYSTEMS','RF',dims=())
+    signals.append(('ech_num_systems',num_systems))
+    for i in range(1,7):
+        signal=MdsSignal(f'ECH.SYSTEM_{i}.GYROTRON.NAME','RF',dims=(),
                          location='remote://atlas.gat.com')
-        pipeline.fetch(f'ech_pwr_total_full',signal)
-        for gyro in ['LEIA', 'LUKE', 'R2D2', #active
-                     'YODA', #starting up
-                     'SCARECROW', 'TINMAN', 'CHEWBACCA', #retired
-                     'TOTO', 'NATASHA', 'KATYA', #not on website but in tree
-                     'LION', 'HAN', 'NASA', 'VADER']: #not operational
-            signal=MdsSignal(f'ECH.{gyro}.EC{gyro[:3]}AZIANG','RF',
-                             location='remote://atlas.gat.com')
-            pipeline.fetch(f'ech_aziang_{gyro}',signal)
-            signal=MdsSignal(f'ECH.{gyro}.EC{gyro[:3]}POLANG','RF',
+        signals.append((f'ech_name_{i}',signal))
+        signal=MdsSignal(f'ECH.SYSTEM_{i}.GYROTRON.FREQUENCY','RF',dims=(),
+                         location='remote://atlas.gat.com')
+        signals.append((f'ech_frequency_{i}',signal))
+        signal=MdsSignal(f'ECH.SYSTEM_{i}.ANTENNA.LAUNCH_R','RF',dims=(),
+                         location='remote://atlas.gat.com')
+        signals.append((f'ech_R_{i}',signal))
+        signal=MdsSignal(f'ECH.SYSTEM_{i}.ANTENNA.LAUNCH_Z','RF',dims=(),
+                         location='remote://atlas.gat.com')
+        signals.append((f'ech_Z_{i}',signal))
+
+    #https://diii-d.gat.com/diii-d/ECHStatus
+    signal=MdsSignal(r'\echpwrc','RF',
+                     location='remote://atlas.gat.com')
+    signals.append((f'ech_pwr_total_full',signal))
+    # The tree has nodes for many gyrotrons, only a few of which are installed at any
+    # one time: 'LEIA', 'LUKE', 'R2D2' (active), 'YODA' (starting up), 'SCARECROW',
+    # 'TINMAN', 'CHEWBACCA' (retired), 'TOTO', 'NATASHA', 'KATYA' (not on website
+    # but in tree), 'LION', 'HAN', 'NASA', 'VADER' (not operational).
+    # So first grab just the gyrotron names for a batch of shots (cheap), then only
+    # fetch time traces for those gyrotrons, see get_ech_gyro_signals
+    ech_name_signals=[('ech_num_systems',num_systems)]
+    ech_name_signals+=[(key,signal) for key,signal in signals if key.startswith('ech_name_')]
+
+ech_gyro_signals={}
+def get_ech_gyro_signals(gyro):
+    if gyro not in ech_gyro_signals:
+        ech_gyro_signals[gyro]=[
+            (f'ech_aziang_{gyro}',MdsSignal(f'ECH.{gyro}.EC{gyro[:3]}AZIANG','RF',
+                                            location='remote://atlas.gat.com')),
+            (f'ech_polang_{gyro}',MdsSignal(f'ECH.{gyro}.EC{gyro[:3]}POLANG','RF',
+                                            location='remote://atlas.gat.com')),
+            (f'ech_pwr_{gyro}',MdsSignal(f'ECH.{gyro}.EC{gyro[:3]}FPWRC','RF',
+                                         location='remote://atlas.gat.com')),
+            (f'ech_xmfrac_{gyro}',MdsSignal(f'ECH.{gyro}.EC{gyro[:3]}XMFRAC','RF',
+                                            location='remote://atlas.gat.com')),
+            (f'ech_stat_{gyro}',MdsSignal(f'ECH.{gyro}.EC{gyro[:3]}STAT','RF',dims=(),
+                                          location='remote://atlas.gat.com'))]
+    return ech_gyro_signals[gyro]
+
+def get_installed_gyros(records):
+    gyros=set()
+    for record in records:
+        if record['ech_num_systems'] is None:
+            continue
+        for i in range(1,record['ech_num_systems']['data']+1):
+            if record[f'ech_name_{i}'] is not None:
+                gyros.add(record[f'ech_name_{i}']['data'].upper())
+    return sorted(gyros)
+
+######## NB DETAILED INFO #########
+if cfg['data']['include_full_nb_data']:
+    for beam in [30,150,210,330]:
+        beam_name=str(beam)[:2]
+        for location in ['L','R']:
+            # PINJ_ is not there for older shots, which is incredibly annoying
+            # DIIID-BEAMS script (see OMFIT-source/modules/DIIID-BEAMS/SCRIPTS/LIB/OMFITlib_utilities)
+            # handles this by taking the scalar value and multiplying by BEAMSTAT
+            signal=MdsSignal(f'NB{beam_name}{location}.PINJ_{beam_name}{location}','NB',
                              location='remote://atlas.gat.com')
-            pipeline.fetch(f'ech_polang_{gyro}',signal)
-            signal=MdsSignal(f'ECH.{gyro}.EC{gyro[:3]}FPWRC','RF',
+            signals.append((f'nb_{beam}{location}_pinj',signal))
+            signal=MdsSignal(f'NB{beam_name}{location}.TINJ_{beam_name}{location}','NB',
                              location='remote://atlas.gat.com')
-            pipeline.fetch(f'ech_pwr_{gyro}',signal)
-            signal=MdsSignal(f'ECH.{gyro}.EC{gyro[:3]}XMFRAC','RF',
+            signals.append((f'nb_{beam}{location}_tinj',signal))
+            signal=MdsSignal(f'NB{beam_name}{location}.VBEAM','NB',
                              location='remote://atlas.gat.com')
-            pipeline.fetch(f'ech_xmfrac_{gyro}',signal)
-            signal=MdsSignal(f'ECH.{gyro}.EC{gyro[:3]}STAT','RF',dims=(),
+            signals.append((f'nb_{beam}{location}_vinj',signal))
+            signal=MdsSignal(f'NB{beam_name}{location}.NBVAC_SCALAR','NB',dims=(),
                              location='remote://atlas.gat.com')
-            pipeline.fetch(f'ech_stat_{gyro}',signal)
+            signals.append((f'nb_{beam}{location}_vinj_scalar',signal))
+    signal=MdsSignal(f'NB15L.OANB.BLPTCH_CAD','NB',dims=(),
+                     location='remote://atlas.gat.com')
+    signals.append((f'nb_150_tilt',signal))
+    signal=MdsSignal(f'NB21L.CCOANB.BLROT','NB',dims=(),
+                     location='remote://atlas.gat.com')
+    signals.append((f'nb_210_rtan',signal))
 
-    ######## NB DETAILED INFO #########
-    if cfg['data']['include_full_nb_data']:
-        for beam in [30,150,210,330]:
-            beam_name=str(beam)[:2]
-            for location in ['L','R']:
-                # PINJ_ is not there for older shots, which is incredibly annoying
-                # DIIID-BEAMS script (see OMFIT-source/modules/DIIID-BEAMS/SCRIPTS/LIB/OMFITlib_utilities)
-                # handles this by taking the scalar value and multiplying by BEAMSTAT
-                signal=MdsSignal(f'NB{beam_name}{location}.PINJ_{beam_name}{location}','NB',
-                                 location='remote://atlas.gat.com')
-                pipeline.fetch(f'nb_{beam}{location}_pinj',signal)
-                signal=MdsSignal(f'NB{beam_name}{location}.TINJ_{beam_name}{location}','NB',
-                                 location='remote://atlas.gat.com')
-                pipeline.fetch(f'nb_{beam}{location}_tinj',signal)
-                signal=MdsSignal(f'NB{beam_name}{location}.VBEAM','NB',
-                                 location='remote://atlas.gat.com')
-                pipeline.fetch(f'nb_{beam}{location}_vinj',signal)
-                signal=MdsSignal(f'NB{beam_name}{location}.NBVAC_SCALAR','NB',dims=(),
-                                 location='remote://atlas.gat.com')
-                pipeline.fetch(f'nb_{beam}{location}_vinj_scalar',signal)
-        signal=MdsSignal(f'NB15L.OANB.BLPTCH_CAD','NB',dims=(),
-                         location='remote://atlas.gat.com')
-        pipeline.fetch(f'nb_150_tilt',signal)
-        signal=MdsSignal(f'NB21L.CCOANB.BLROT','NB',dims=(),
-                         location='remote://atlas.gat.com')
-        pipeline.fetch(f'nb_210_rtan',signal)
+for which_shot,shots in enumerate(subshots):
+    print(f'Starting shot {shots[0]}-{shots[-1]}')
+    sys.stdout.flush()
+
+    print('Gathering timebased signals')
+    # pipeline for regular signals
+    pipeline = Pipeline(shots.tolist())
+    for key,signal in signals:
+        pipeline.fetch(key,signal)
+    if cfg['data']['include_full_ech_data']:
+        ech_pipeline = Pipeline(shots.tolist())
+        for key,signal in ech_name_signals:
+            ech_pipeline.fetch(key,signal)
+        for gyro in get_installed_gyros(compute_records(ech_pipeline)):
+            for key,signal in get_ech_gyro_signals(gyro):
+                pipeline.fetch(key,signal)
 
     @pipeline.map
     def add_timebase(record):
-        standard_times=np.arange(cfg['data']['tmin'],cfg['data']['tmax'],cfg['data']['time_step'])
+        # shared across records; nothing downstream modifies it in place
         record['standard_time']=standard_times
 
     if cfg['data']['include_full_ech_data']:
@@ -531,6 +585,11 @@ for which_shot,shots in enumerate(subshots):
                         record[f'ech_{key}'].append(standardize_time(record[f'ech_{key}_{gyro}']['data'],
                                                                     record[f'ech_{key}_{gyro}']['times'],
                                                                     record['standard_time']))
+                # one row per system rather than lists of arrays
+                for key in sigs_0d:
+                    record[f'ech_{key}']=np.array(record[f'ech_{key}'])
+                for key in sigs_1d:
+                    record[f'ech_{key}']=stack_time_traces(record[f'ech_{key}'],record['standard_time'])
 
     if cfg['data']['include_full_nb_data']:
         @pipeline.map
@@ -554,51 +613,59 @@ for which_shot,shots in enumerate(subshots):
                                                                         record['standard_time']))
                         except:
                             pass
+                # one row per beam that has data rather than lists of arrays
+                record[f'nb_{sig}']=stack_time_traces(record[f'nb_{sig}'],record['standard_time'])
             for beam in [30,150,210,330]:
                 for location in ['L','R']:
                     record['nb_vinj_scalar'].append(record[f'nb_{beam}{location}_vinj_scalar']['data'])
 
     @pipeline.map
     def change_timebase(record):
-        all_sig_names=needed_sigs
-        for sig_name in all_sig_names:
+        for sig_name in timebase_sigs:
+            full_key=sig_name+'_full'
+            # derived signals have no raw version, and failed fetches come back as None
+            if full_key not in record or record[full_key] is None:
+                continue
             try:
-                numpy_smoothing_fxn=np.mean
-                if sig_name.casefold() in modal_sig_names:
-                    def get_mode(arr, axis=0):
-                        return np.squeeze(stats.mode(a=arr, axis=axis)[0])
-                    numpy_smoothing_fxn=get_mode
-                record[sig_name]=standardize_time(record['{}_full'.format(sig_name)]['data'],
-                                                  record['{}_full'.format(sig_name)]['times'],
+                record[sig_name]=standardize_time(record[full_key]['data'],
+                                                  record[full_key]['times'],
                                                   record['standard_time'],
-                                                  numpy_smoothing_fxn=numpy_smoothing_fxn)
-            except:
+                                                  numpy_smoothing_fxn=smoothing_fxns[sig_name])
+            except (ValueError, IndexError, TypeError):
                 pass
         for efit_type in cfg['data']['efit_types']:
+            # all profiles of an EFIT share the same psi grid, so only
+            # recompute the interpolation weights if it actually changes
+            cached_psi=None
             for base_sig in cfg['data']['efit_profile_sig_names']:
                 sig_name=f'{base_sig}_{efit_type}'
-                data=[]
-                for time_ind in range(len(record[sig_name])):
-                    interpolator=interpolate.interp1d(record[f'{sig_name}_full']['psi'],
-                                                      record[sig_name][time_ind,:])
-                    data.append(interpolator(standard_x))
-                record[sig_name]=np.array(data)
+                psi=record[f'{sig_name}_full']['psi']
+                profiles=record[sig_name]
+                # interpolation needs an increasing grid
+                if psi[0]>psi[-1]:
+                    psi=psi[::-1]
+                    profiles=profiles[:,::-1]
+                if cached_psi is None or not np.array_equal(psi,cached_psi):
+                    cached_psi=psi
+                    idx,w=interp_weights(psi,standard_x)
+                record[sig_name]=profiles[:,idx]*(1-w)+profiles[:,idx+1]*w
+        drop_raw_signals(record,[sig_name+'_full' for sig_name in timebase_sigs
+                                 if sig_name not in reread_sigs])
 
     if cfg['data']['include_psirz'] or psirz_needed:
         @pipeline.map
         def add_psin(record):
-            psi_norm_f = record['ssibry_full']['data'] - record['ssimag_full']['data']
-            # Prevent divide by 0 error by replacing 0s in the denominator
-            problems = psi_norm_f == 0
-            psi_norm_f[problems] = 1.
-            record['psirz'] = (record['psirz_full']['data'] - record['ssimag_full']['data'][:, np.newaxis, np.newaxis]) / psi_norm_f[:, np.newaxis, np.newaxis]
-            record['psirz'][problems] = 0
+            psi_norm_f = (record['ssibry_full']['data'] - record['ssimag_full']['data'])[:, np.newaxis, np.newaxis]
+            psirz = record['psirz_full']['data'] - record['ssimag_full']['data'][:, np.newaxis, np.newaxis]
+            # Prevent divide by 0 error: times with a 0 denominator are skipped and left at 0
+            record['psirz'] = np.divide(psirz, psi_norm_f, out=np.zeros_like(psirz), where=psi_norm_f != 0)
 
             record['psirz']=standardize_time(record['psirz'],
                                                   record['psirz_full']['times'],
                                                   record['standard_time'])
             record['psirz_r']=record['psirz_full']['r']
             record['psirz_z']=record['psirz_full']['z']
+            drop_raw_signals(record,['psirz_full','ssimag_full','ssibry_full'])
 
     @pipeline.map
     def zipfit_rho(record):
@@ -606,13 +673,9 @@ for which_shot,shots in enumerate(subshots):
             record['zipfit_{}_rhon_basis'.format(sig_name)]=standardize_time(record['zipfit_{}_full'.format(sig_name)]['data'],
                                                                              record['zipfit_{}_full'.format(sig_name)]['times'],
                                                                              record['standard_time'])
-            tmp=[]
-            rhon=record['zipfit_{}_full'.format(sig_name)]['rhon']
-            for time_ind in range(len(record['standard_time'])):
-                rho_to_zipfit=my_interp(rhon,
-                                        record['zipfit_{}_rhon_basis'.format(sig_name)][time_ind])
-                tmp.append(rho_to_zipfit(standard_x))
-            record['zipfit_{}_rho'.format(sig_name)]=np.array(tmp)
+            record['zipfit_{}_rho'.format(sig_name)]=interp_rows(standard_x,
+                                                                record['zipfit_{}_full'.format(sig_name)]['rhon'],
+                                                                record['zipfit_{}_rhon_basis'.format(sig_name)])
 
     if cfg['data']['include_rhovn'] or len(cfg['data']['zipfit_sig_names'])>0:
         @pipeline.map
@@ -623,12 +686,10 @@ for which_shot,shots in enumerate(subshots):
         @pipeline.map
         def zipfit_psi(record):
             for sig_name in cfg['data']['zipfit_sig_names']:
-                rho_to_psi=[my_interp(record['rhovn'][time_ind],
-                                      record['rhovn_full']['psi']) for time_ind in range(len(record['standard_time']))]
-                record['zipfit_{}_psi_full'.format(sig_name)]=[]
-                for time_ind in range(len(record['standard_time'])):
-                    record['zipfit_{}_psi_full'.format(sig_name)].append(rho_to_psi[time_ind](record['zipfit_{}_full'.format(sig_name)]['rhon']))
-                record['zipfit_{}_psi_full'.format(sig_name)]=np.array(record['zipfit_{}_psi_full'.format(sig_name)])
+                # psi of the zipfit rho grid at each time, from rhovn(psi) read backwards
+                record['zipfit_{}_psi_full'.format(sig_name)]=interp_rows(record['zipfit_{}_full'.format(sig_name)]['rhon'],
+                                                                          record['rhovn'],
+                                                                          record['rhovn_full']['psi'])
 
                 zipfit_interp=fit_function_dict['linear_interp_1d']
                 record['zipfit_{}_psi'.format(sig_name)]=zipfit_interp(record['zipfit_{}_psi_full'.format(sig_name)],
@@ -637,6 +698,16 @@ for which_shot,shots in enumerate(subshots):
                                                                    np.ones(record['zipfit_{}_rhon_basis'.format(sig_name)].shape),
                                                                    standard_x)
         #        record['zipfit_{}'.format(sig_name)]=record['zipfit_{}_full'.format(sig_name)]
+            drop_raw_signals(record,['rhovn_full']+['zipfit_{}_full'.format(sig_name)
+                                                    for sig_name in cfg['data']['zipfit_sig_names']])
+
+    if psirz_needed:
+        @pipeline.map
+        def add_psirz_interpolator(record):
+            # one (z, r) interpolator of psirz at each standard time for every thomson and CER channel; it
+            # only lives between stages on the worker, keep() drops it before results return
+            record['r_z_to_psi']=psirz_interpolator(record['psirz'],record['standard_time'],
+                                                    record['psirz_r'],record['psirz_z'])
 
     @pipeline.map
     def map_thomson_1d(record):
@@ -644,105 +715,126 @@ for which_shot,shots in enumerate(subshots):
         if len(cfg['data']['thomson_sig_names']) == 0:
             return
 
-        # an rz interpolator for each standard time
-        r_z_to_psi=[interpolate.interp2d(record['psirz_r'],
-                                         record['psirz_z'],
-                                         record['psirz'][time_ind]) for time_ind in range(len(record['standard_time']))]
+        r_z_to_psi=record['r_z_to_psi']
 
         for sig_name in cfg['data']['thomson_sig_names']:
-            value=[]
-            psi=[]
-            uncertainty=[]
-            for thomson_area in thomson_areas:
-                if record['thomson_{}_{}_full'.format(thomson_area,sig_name)]==None:
-                    continue
-                num_channels=len(record['thomson_{}_{}_full'.format(thomson_area,sig_name)]['position'])
-                for channel in range(num_channels):
-                    # gather r, z, and psi values: needed whether using thomson or pcs
-                    if thomson_area=='TANGENTIAL':
-                        r=record['thomson_{}_{}_full'.format(thomson_area,sig_name)]['position'][channel]
-                        z=0
-                    elif thomson_area=='CORE':
-                        z=record['thomson_{}_{}_full'.format(thomson_area,sig_name)]['position'][channel]
-                        r=1.94
-                    psi.append([r_z_to_psi[time_ind](r,z)[0] for time_ind in range(len(record['standard_time']))])
-                    # really dumb: uncertainties aren't written from the Thomson algo so even if we want PCS thomson signals we need offline uncertainties still
-                    if cfg['data']['include_thomson_uncertainty']:
-                        uncertainty.append(standardize_time(record['thomson_{}_{}_uncertainty_full'.format(thomson_area,sig_name)]['data'][channel]/thomson_mds_scale[sig_name],
-                                                            record['thomson_{}_{}_uncertainty_full'.format(thomson_area,sig_name)]['times'],
-                                                            record['standard_time']))
-                    value.append(standardize_time(record['thomson_{}_{}_full'.format(thomson_area,sig_name)]['data'][channel]/thomson_mds_scale[sig_name],
-                                                      record['thomson_{}_{}_full'.format(thomson_area,sig_name)]['times'],
-                                                      record['standard_time']))
-                    # here's where we would add the uncertainty
-                    # if cfg['data']['include_thomson_uncertainty']:
-                    #     uncertainty.append(standardize_time(record['thomson_rt_{}_{}_{}_uncertainty_full'.format(thomson_area,sig_name,channel)]['data'],
-                    #                               record['thomson_rt_{}_{}_{}_uncertainty_full'.format(thomson_area,sig_name,channel)]['times'],
-                    #                               record['standard_time']))
-
-            value=np.array(value).T
-            psi=np.array(psi).T
-            value[np.isclose(value,0)]=np.nan
+            # count channels first so everything is filled straight into (time, channel) arrays;
+            # only CORE and TANGENTIAL have an R/Z mapping, other areas would feed NaN psi to the fits
+            areas=[thomson_area for thomson_area in thomson_areas
+                   if thomson_area in ('CORE','TANGENTIAL')
+                   and record['thomson_{}_{}_full'.format(thomson_area,sig_name)] is not None]
+            area_channels=[len(record['thomson_{}_{}_full'.format(thomson_area,sig_name)]['position'])
+                           for thomson_area in areas]
+            value=np.empty((len(record['standard_time']),sum(area_channels)),dtype=raw_1d_dtype)
+            channel_r=np.empty(sum(area_channels))
+            channel_z=np.empty(sum(area_channels))
             if cfg['data']['include_thomson_uncertainty']:
-                uncertainty=np.array(uncertainty).T
-                #value[np.isclose(uncertainty,0)]=np.nan
-                uncertainty[np.isclose(uncertainty,0)]=0.1
+                uncertainty=np.empty(value.shape,dtype=raw_1d_dtype)
             else:
-                uncertainty=np.ones(np.shape(value))
+                uncertainty=np.ones(value.shape,dtype=raw_1d_dtype)
+            channel_ind=0
+            for thomson_area,num_channels in zip(areas,area_channels):
+                thomson_full=record['thomson_{}_{}_full'.format(thomson_area,sig_name)]
+                area_inds=slice(channel_ind,channel_ind+num_channels)
+                # gather r, z, and psi values: needed whether using thomson or pcs
+                if thomson_area=='TANGENTIAL':
+                    channel_r[area_inds]=thomson_full['position']
+                    channel_z[area_inds]=0
+                elif thomson_area=='CORE':
+                    channel_z[area_inds]=thomson_full['position']
+                    channel_r[area_inds]=1.94
+                # channels of an area share a timebase, so rebase them all at once as (time, channel)
+                # really dumb: uncertainties aren't written from the Thomson algo so even if we want PCS thomson signals we need offline uncertainties still
+                if cfg['data']['include_thomson_uncertainty']:
+                    uncertainty_full=record['thomson_{}_{}_uncertainty_full'.format(thomson_area,sig_name)]
+                    uncertainty[:,area_inds]=standardize_time(uncertainty_full['data'][:num_channels].T/thomson_mds_scale[sig_name],
+                                                              uncertainty_full['times'],
+                                                              record['standard_time'])
+                value[:,area_inds]=standardize_time(thomson_full['data'][:num_channels].T/thomson_mds_scale[sig_name],
+                                                    thomson_full['times'],
+                                                    record['standard_time'])
+                channel_ind+=num_channels
+                # here's where we would add the uncertainty
+                # if cfg['data']['include_thomson_uncertainty']:
+                #     uncertainty.append(standardize_time(record['thomson_rt_{}_{}_{}_uncertainty_full'.format(thomson_area,sig_name,channel)]['data'],
+                #                               record['thomson_rt_{}_{}_{}_uncertainty_full'.format(thomson_area,sig_name,channel)]['times'],
+                #                               record['standard_time']))
+
+            psi=r_z_to_psi(channel_r,channel_z).astype(raw_1d_dtype)
+            # same mask as np.isclose(value,0), whose tolerance reduces to atol=1e-8 against 0
+            value[np.abs(value)<=1e-8]=np.nan
+            if cfg['data']['include_thomson_uncertainty']:
+                #value[np.isclose(uncertainty,0)]=np.nan
+                uncertainty[np.abs(uncertainty)<=1e-8]=0.1
             record['thomson_{}_raw_1d'.format(sig_name)]=value
             record['thomson_{}_uncertainty_raw_1d'.format(sig_name)]=uncertainty
             record['thomson_{}_psi_raw_1d'.format(sig_name)]=psi
             for trial_fit in cfg['data']['trial_fits']:
                 if trial_fit in fit_functions_1d:
                     record['thomson_{}_{}'.format(sig_name,trial_fit)] = fit_function_dict[trial_fit](psi,record['standard_time'],value,uncertainty,standard_x)
+            drop_raw_signals(record,['thomson_{}_{}_{}'.format(thomson_area,sig_name,suffix)
+                                     for thomson_area in thomson_areas
+                                     for suffix in ['full','uncertainty_full']])
     @pipeline.map
     def map_cer_1d(record):
         # Don't run if we don't want any CER signals
         if len(cfg['data']['cer_sig_names']) == 0:
             return
 
-        # an rz interpolator for each standard time
-        r_z_to_psi=[interpolate.interp2d(record['psirz_r'],
-                                         record['psirz_z'],
-                                         record['psirz'][time_ind]) for time_ind in range(len(record['standard_time']))]
+        r_z_to_psi=record['r_z_to_psi']
+
+        # R and Z of a channel are the same for every CER signal, so rebase them once,
+        # on the timebase of the first signal the channel has
+        channel_r_z={}
+        for cer_area in cer_areas:
+            for channel in cer_channels[cer_area]:
+                for sig_name in cfg['data']['cer_sig_names']:
+                    cer_full=record['cer_{}_{}_{}_full'.format(cer_area,sig_name,channel)]
+                    if cer_full is not None:
+                        channel_r_z[(cer_area,channel)]=[standardize_time(record['cer_{}_{}_{}_full'.format(cer_area,channel,coord)]['data'],
+                                                                          cer_full['times'],
+                                                                          record['standard_time'])
+                                                         for coord in ['R','Z']]
+                        break
 
         for sig_name in cfg['data']['cer_sig_names']:
-            value=[]
-            psi=[]
-            error=[]
-            for cer_area in cer_areas:
-                for channel in cer_channels[cer_area]:
-                    if record['cer_{}_{}_{}_full'.format(cer_area,sig_name,channel)] is not None:
-                        r=standardize_time(record['cer_{}_{}_R_full'.format(cer_area,channel)]['data'],
-                                           record['cer_{}_{}_{}_full'.format(cer_area,sig_name,channel)]['times'],
-                                           record['standard_time'])
-                        z=standardize_time(record['cer_{}_{}_Z_full'.format(cer_area,channel)]['data'],
-                                           record['cer_{}_{}_{}_full'.format(cer_area,sig_name,channel)]['times'],
-                                           record['standard_time'])
-
-                        value.append(standardize_time(record['cer_{}_{}_{}_full'.format(cer_area,sig_name,channel)]['data'],
-                                                      record['cer_{}_{}_{}_full'.format(cer_area,sig_name,channel)]['times'],
-                                                      record['standard_time']))
-                        # set to true for rotation if we want to convert km/s to krad/s
-                        if (sig_name=='rot' and cfg['data']['cer_rotation_units_of_krad']):
-                            value[-1]=np.divide(value[-1],r)
-                        psi.append([r_z_to_psi[time_ind](r[time_ind],z[time_ind])[0] \
-                                    for time_ind in range(len(record['standard_time']))])
-                        error.append(standardize_time(record['cer_{}_{}_{}_error_full'.format(cer_area,sig_name,channel)]['data'],
-                                                      record['cer_{}_{}_{}_error_full'.format(cer_area,sig_name,channel)]['times'],
-                                                      record['standard_time']))
-            value=np.array(value).T/cer_scale[sig_name]
-            psi=np.array(psi).T
-            error=np.array(error).T
-            value[np.where(error==1)]=np.nan
-            uncertainty=np.ones(np.shape(value))
+            channels=[(cer_area,channel) for cer_area in cer_areas for channel in cer_channels[cer_area]
+                      if record['cer_{}_{}_{}_full'.format(cer_area,sig_name,channel)] is not None]
+            value=np.empty((len(record['standard_time']),len(channels)),dtype=raw_1d_dtype)
+            channel_r=np.empty(value.shape)
+            channel_z=np.empty(value.shape)
+            error=np.empty(value.shape,dtype=raw_1d_dtype)
+            for channel_ind,(cer_area,channel) in enumerate(channels):
+                cer_full=record['cer_{}_{}_{}_full'.format(cer_area,sig_name,channel)]
+                error_full=record['cer_{}_{}_{}_error_full'.format(cer_area,sig_name,channel)]
+                channel_r[:,channel_ind],channel_z[:,channel_ind]=channel_r_z[(cer_area,channel)]
+                value[:,channel_ind]=standardize_time(cer_full['data'],
+                                                      cer_full['times'],
+                                                      record['standard_time'])
+                error[:,channel_ind]=standardize_time(error_full['data'],
+                                                      error_full['times'],
+                                                      record['standard_time'])
+            # set to true for rotation if we want to convert km/s to krad/s
+            if (sig_name=='rot' and cfg['data']['cer_rotation_units_of_krad']):
+                value/=channel_r
+            value/=cer_scale[sig_name]
+            psi=r_z_to_psi(channel_r,channel_z).astype(raw_1d_dtype)
+            value[error==1]=np.nan
+            uncertainty=np.ones(np.shape(value),dtype=raw_1d_dtype)
             record['cer_{}_raw_1d'.format(sig_name)]=value
             record['cer_{}_uncertainty_raw_1d'.format(sig_name)]=uncertainty
             record['cer_{}_psi_raw_1d'.format(sig_name)]=psi
-            record['cer_{}_r_raw_1d'.format(sig_name)]=r
+            record['cer_{}_r_raw_1d'.format(sig_name)]=channel_r.astype(raw_1d_dtype)
             for trial_fit in cfg['data']['trial_fits']:
                 if trial_fit in fit_functions_1d:
                     record['cer_{}_{}'.format(sig_name,trial_fit)] = fit_function_dict[trial_fit](psi,record['standard_time'],value,uncertainty,standard_x)
+            drop_raw_signals(record,['cer_{}_{}_{}_{}'.format(cer_area,sig_name,channel,suffix)
+                                     for cer_area in cer_areas for channel in cer_channels[cer_area]
+                                     for suffix in ['full','error_full']])
+        # R and Z are shared by all CER signals
+        drop_raw_signals(record,['cer_{}_{}_{}_full'.format(cer_area,channel,coord)
+                                 for cer_area in cer_areas for channel in cer_channels[cer_area]
+                                 for coord in ['R','Z']])
 
     @pipeline.map
     def pcs_processing(record):
@@ -750,6 +842,7 @@ for which_shot,shots in enumerate(subshots):
             record['{}'.format(sig_name)]=standardize_time(record['{}_full'.format(sig_name)]['data'],
                                                            record['{}_full'.format(sig_name)]['times'][:],
                                                            record['standard_time'])
+        drop_raw_signals(record,['{}_full'.format(sig_name) for sig_name in cfg['data']['pcs_sig_names']])
 
     
     if len(cfg['data']['aot_prof_sig_names']) > 0:
@@ -767,7 +860,8 @@ for which_shot,shots in enumerate(subshots):
                                                     window_size=200,
                                                     exponential_falloff=True,
                                                     falloff_rate=20).T
-            record['aot_prof_rho'] = np.linspace(0,1,201)
+            record['aot_prof_rho'] = aot_prof_rho
+            drop_raw_signals(record,[f'{sig_name}_full' for sig_name in cfg['data']['aot_prof_sig_names']])
 
 
     if True: #not cfg['data']['gather_raw']: <-- deprecated (annoying to gather random datatypes into h5)
@@ -785,25 +879,79 @@ for which_shot,shots in enumerate(subshots):
     #     needed_sigs.append('{}_uncertainty_raw_1d'.format(cfg['logistics']['debug_sig_name']))
 
     with Timer():
-        if cfg['logistics']['num_processes']>1:
-            # note use compute_spark for Iris, compute_ray for saga
-            records=pipeline.compute_ray(numparts=cfg['logistics']['num_processes'])
-        else:
-            records=pipeline.compute_serial()
-    # check if MDSplus has crashed. If so, close current run and rerun launch ensemble from next shot
-    break_condition = False
-    for record in records:
-        error_check = [key for key in record['errors'].keys() if 'Failure to complete operation' in record['errors'][key]['traceback']]
-        if len(error_check)>0:
-            print('MDSplus has crashed at shot ' + str(shots[0]) + ', rerunning the script...')
-            from launch_parallel_jobs_function import submit_single_run
-            submit_single_run(args.config_filename, min(all_shots), shots[0]-1,  )
-            break_condition = True
+        records=compute_records(pipeline)
+
+    # a single handle for all of this batch's writes (SQL and timebased)
+    with open_output_file(filename) as final_data:
+        print('Writing summary SQL signals')
+        # pipeline for SQL signals
+        if len(cfg['data']['sql_sig_names'])>0:
+            conn = connect_d3drdb()
+            for sql_shots in sql_batches(shots):
+                # you can continue adding joins to make sure all signals get collected
+                query="""SELECT summaries.shot,{}
+                         FROM summaries
+                         INNER JOIN shots ON summaries.shot=shots.shot
+                         WHERE summaries.shot in {}
+                      """.format(
+                    ','.join(cfg['data']['sql_sig_names']),
+                    sql_in_clause(sql_shots)
+                    )
+                sql_pipeline = Pipeline.from_sql(conn, query)
+                sql_records=compute_records(sql_pipeline)
+                write_sql_records(final_data,sql_records,cfg['data']['sql_sig_names'])
+                final_data.flush()
+
+        print('Writing gas SQL signals')
+        # pipeline for GAS
+        if cfg['data']['include_gas_valve_info']:
+            gas_sigs=['gas','valve']
+            conn = connect_d3drdb()
+            for sql_shots in sql_batches(shots):
+                # you can continue adding joins to make sure all signals get collected
+                query="""SELECT shot,{}
+                         FROM gasvalves
+                         WHERE shot in {}
+                      """.format(
+                    ','.join(gas_sigs),
+                    sql_in_clause(sql_shots)
+                    )
+                sql_pipeline = Pipeline.from_sql(conn, query)
+                sql_records=compute_records(sql_pipeline)
+                write_sql_lists(final_data,sql_records,sql_shots,gas_sigs)
+                final_data.flush()
+
+        print('Writing log SQL signals')
+        # pipeline for LOGS
+        if cfg['data']['include_log_info']:
+            log_sigs=['text','topic','username']
+            conn = connect_d3drdb()
+            for sql_shots in sql_batches(shots):
+                query="""SELECT shot,{}
+                         FROM entries
+                         WHERE shot in {}
+                      """.format(
+                    ','.join(log_sigs),
+                    sql_in_clause(sql_shots)
+                    )
+                sql_pipeline = Pipeline.from_sql(conn, query)
+                sql_records=compute_records(sql_pipeline)
+                write_sql_lists(final_data,sql_records,sql_shots,log_sigs)
+                final_data.flush()
+
+        # check if MDSplus has crashed. If so, close current run and rerun launch ensemble from next shot
+        break_condition = False
+        for record in records:
+            error_check = [key for key in record['errors'].keys() if 'Failure to complete operation' in record['errors'][key]['traceback']]
+            if len(error_check)>0:
+                print('MDSplus has crashed at shot ' + str(shots[0]) + ', rerunning the script...')
+                from launch_parallel_jobs_function import submit_single_run
+                submit_single_run(args.config_filename, all_shots[-1], shots[0]-1,  )
+                break_condition = True
+                break
+        if break_condition:
             break
-    if break_condition:
-        break
-    print('Writing timebased signals')
-    with h5py.File(filename,'a') as final_data:
+        print('Writing timebased signals')
         for record in records:
             print('Keys grabbed: '+ str(record.keys()))
             shot=str(record['shot'])
@@ -811,9 +959,7 @@ for which_shot,shots in enumerate(subshots):
             for sig in record.keys():
                 if sig=='shot' or sig=='errors':
                     continue
-                if sig in final_data[shot]:
-                    del final_data[shot][sig]
-                final_data[shot][sig]=record[sig]
+                write_dataset(final_data[shot],sig,record[sig])
                 # print(sig)
                 # print(record[sig])
             # DIII-D stores gas data by valve (gasA, gasB, ... pfx1,...)
@@ -822,27 +968,23 @@ for which_shot,shots in enumerate(subshots):
             if len(cfg['data']['combined_gas_types'])>0 \
                     and cfg['data']['include_gas_valve_info'] \
                     and len(cfg['data']['gas_cal_sig_names'])>0:
-                # full list of unique valves and gases below
-                # {'LOB1', 'PFX2', 'A', 'B', 'PFX1', 'C', 'DRDP', 'LOB2', 'D', 'UOB', 'E', 'CPGAS', 'PFX3'}
-                # {'XE', 'He   ', 'CH4', '13CD4', 'D2', 'Xe', 'None ', 'D2   ', 'Ne', 'KR', '5-Xe_95-D2', 'None', 'H2   ', 'Ne   ', 'Tokamakium', 'Ar   ', ' ', 'AR/N2', 'Ar', 'NE', 'He', 'N2', 'He3', 'HE', 'AR', '10-Kr_90-D2', 'H2', 'CH4  '}
-                # could use regex if necessary, instead just strip and upper ( print(re.search(r'^D2?$', 'D2')) )
-                valve_mapping={'gasA': 'A', 'gasB': 'B', 'gasC': 'C', 'gasD': 'D', 'gasE': 'E',
-                               'pfx1': 'PFX1', 'pfx2': 'PFX2', 'pfx3': 'PFX3', 'uob': 'UOB'}
-                gas_mapping={'D2': 'D_tot', 'N2': 'N_tot', 'H2': 'H_tot',
-                             'HE': 'He_tot', 'NE': 'Ne_tot', 'AR': 'Ar_tot'}
-                valves=[valve.decode('utf-8') for valve in final_data[shot]['valve_sql'][:]]
-                gases=[gas.decode('utf-8') for gas in final_data[shot]['gas_sql'][:]]
+                valves=final_data[shot]['valve_sql'].asstr()[:].tolist()
+                gases=[gas.strip().upper() for gas in final_data[shot]['gas_sql'].asstr()[:]]
+                # row of each valve's first entry, like valves.index would give
+                valve_inds={valve: ind for ind,valve in reversed(list(enumerate(valves)))}
                 for gas in cfg['data']['combined_gas_types']:
-                    final_data[shot][gas]=np.zeros(len(standard_times))
+                    write_dataset(final_data[shot],gas,np.zeros(len(standard_times)))
+                # list the shot's signals once rather than per valve
+                shot_keys=set(final_data[shot].keys())
                 for valve in valve_mapping:
-                    if valve in final_data[shot].keys() and valve_mapping[valve] in valves:
-                        ind=valves.index(valve_mapping[valve])
-                        gas=gases[ind].strip().upper()
+                    if valve in shot_keys and valve_mapping[valve] in valve_inds:
+                        gas=gases[valve_inds[valve_mapping[valve]]]
                         if gas in gas_mapping:
-                            mapped_gas=gas_mapping[gas.strip().upper()]
+                            mapped_gas=gas_mapping[gas]
                             if mapped_gas in cfg['data']['combined_gas_types']:
                                 final_data[shot][mapped_gas][:]+=final_data[shot][valve][:]
             if cfg['logistics']['print_errors']:
                 for key in record['errors']:
                     print(key)
-                    print(record['errors'][key]['traceback'].replace('\\n','\n'))
\ No newline at end of file
+                    print(record['errors'][key]['traceback'].replace('\\n','\n'))
+        final_data.flush()
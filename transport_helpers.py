@@ -2,6 +2,22 @@ import numpy as np
 from scipy import interpolate
 import time
 
+# numba is optional, without it the kernels below run as plain python
+try:
+    import numba
+    from numba import prange
+except ImportError:
+    numba=None
+    prange=range
+
+def _compile_kernel(kernel,signatures):
+    # a stale or broken on-disk cache makes the eager compile raise, which shouldn't
+    # stop the import, so fall back to compiling (uncached) on the first call
+    try:
+        return numba.njit(signatures,parallel=True,cache=True)(kernel)
+    except Exception:
+        return numba.njit(parallel=True)(kernel)
+
 def fill_value(arr2d):
     # dv is differential so will be missing the last volume element
     # this is a hack, but we add the last psi value for each time
@@ -42,6 +58,10 @@ def standardize_time(old_signal,old_timebase,standard_times,
     numpy_smoothing_fxn -- some function that takes in an array and an array axis along which to apply (e.g. mean, mode, etc)
     falloff_rate -- (only used if exponential_falloff True) 1/e decay of importance in time
     """
+    if numba is not None and (exponential_falloff or numpy_smoothing_fxn is np.mean) \
+       and len(old_signal)==len(old_timebase) and np.all(np.diff(old_timebase)>=0):
+        return _standardize_time_compiled(old_signal,old_timebase,standard_times,causal,window_size,
+                                          exponential_falloff,falloff_rate)
     new_signal=[]
     for i in range(len(standard_times)):
         if causal:
@@ -62,6 +82,115 @@ def standardize_time(old_signal,old_timebase,standard_times,
                 new_signal.append(numpy_smoothing_fxn(old_signal[inds_in_range],axis=0))
     return np.array(new_signal)
 
+def _standardize_time_compiled(old_signal,old_timebase,standard_times,causal,window_size,
+                               exponential_falloff,falloff_rate):
+    # same windows as the loop in standardize_time, found by bisection since old_timebase is sorted
+    # the compiled signatures take writeable float64 arrays (or a float32 signal, summed
+    # in float64), so only read-only or other-typed inputs get copied
+    signal_dtype=np.float32 if old_signal.dtype==np.float32 else np.float64
+    old_signal=np.require(old_signal,dtype=signal_dtype,requirements='W')
+    old_timebase=np.require(old_timebase,dtype=np.float64,requirements='W')
+    standard_times=np.require(standard_times,dtype=np.float64,requirements='W')
+    lo=np.searchsorted(old_timebase,standard_times-window_size,side='left').astype(np.int64)
+    if causal:
+        hi=np.searchsorted(old_timebase,standard_times,side='left').astype(np.int64)
+    else:
+        hi=np.searchsorted(old_timebase,standard_times+window_size,side='left').astype(np.int64)
+    signal=old_signal.reshape(len(old_signal),-1)
+    # separate kernels so the boxcar loop doesn't branch on the weighting
+    if exponential_falloff:
+        new_signal=_windowed_falloff_mean(signal,old_timebase,standard_times,lo,hi,float(falloff_rate))
+    else:
+        # np.mean in the uncompiled loop keeps float32, so cast back (falloff weights are float64 there too)
+        new_signal=_windowed_mean(signal,lo,hi).astype(signal_dtype,copy=False)
+    return new_signal.reshape((len(standard_times),)+old_signal.shape[1:])
+
+def _windowed_mean(signal,lo,hi):
+    new_signal=np.empty((len(lo),signal.shape[1]))
+    for i in prange(len(lo)):
+        for j in range(signal.shape[1]):
+            if hi[i]<=lo[i]:
+                new_signal[i,j]=np.nan
+            else:
+                total=0.
+                for k in range(lo[i],hi[i]):
+                    total+=signal[k,j]
+                new_signal[i,j]=total/(hi[i]-lo[i])
+    return new_signal
+
+def _windowed_falloff_mean(signal,old_timebase,standard_times,lo,hi,falloff_rate):
+    new_signal=np.empty((len(lo),signal.shape[1]))
+    for i in prange(len(lo)):
+        if hi[i]<=lo[i]:
+            new_signal[i,:]=np.nan
+            continue
+        weights=np.exp(-np.abs(standard_times[i]-old_timebase[lo[i]:hi[i]])/falloff_rate)
+        weights/=weights.sum()
+        for j in range(signal.shape[1]):
+            total=0.
+            for k in range(lo[i],hi[i]):
+                total+=signal[k,j]*weights[k-lo[i]]
+            new_signal[i,j]=total
+    return new_signal
+
+# compiled eagerly for the float32/float64 inputs _standardize_time_compiled passes,
+# so the first record doesn't pay for type inference
+if numba is not None:
+    _windowed_mean=_compile_kernel(_windowed_mean,
+                                   ['float64[:,:](float64[:,:],int64[:],int64[:])',
+                                    'float64[:,:](float32[:,:],int64[:],int64[:])'])
+    _windowed_falloff_mean=_compile_kernel(_windowed_falloff_mean,
+                                           ['float64[:,:](float64[:,:],float64[:],float64[:],int64[:],int64[:],float64)',
+                                            'float64[:,:](float32[:,:],float64[:],float64[:],int64[:],int64[:],float64)'])
+
+def get_mode(arr,axis=0):
+    """ Most common value along axis, for integer-valued signals (e.g. PCS waveforms)
+
+    Counts with np.bincount, so assumes the values span a small range.
+    Ties go to the smallest value, like scipy.stats.mode.
+    Non-finite samples are ignored; a column with none left gives NaN
+    """
+    arr=np.moveaxis(np.asarray(arr),axis,0)
+    columns=arr.reshape(len(arr),-1).T
+    mode=np.full(len(columns),np.nan)
+    for i,column in enumerate(columns):
+        ints=column[np.isfinite(column)].astype(np.int64)
+        if len(ints)>0:
+            offset=ints.min()
+            mode[i]=np.bincount(ints-offset).argmax()+offset
+    return np.squeeze(mode.reshape(arr.shape[1:]).astype(arr.dtype))
+
+def stack_time_traces(traces,standard_times):
+    """ Stack a list of signals already rebased to standard_times into a 2D (signal, time) array """
+    if len(traces)==0:
+        return np.empty((0,len(standard_times)))
+    return np.stack(traces)
+
+def interp_rows(new_x,x,y):
+    """ np.interp(new_x,x[i],y[i]) for every row i, as one (row, len(new_x)) array
+
+    x and y are (row, point) arrays, or a single (point,) array shared by all rows.
+    x must be increasing along each row; rows where x has a NaN come out all NaN
+    """
+    x=np.atleast_2d(x)
+    y=np.atleast_2d(y)
+    num_rows=max(len(x),len(y))
+    x=np.require(np.broadcast_to(x,(num_rows,x.shape[1])),dtype=np.float64,requirements='CW')
+    y=np.require(np.broadcast_to(y,(num_rows,y.shape[1])),dtype=np.float64,requirements='CW')
+    return _interp_rows(np.require(new_x,dtype=np.float64,requirements='W'),x,y)
+
+def _interp_rows(new_x,x,y):
+    new_y=np.empty((x.shape[0],len(new_x)))
+    for i in prange(x.shape[0]):
+        if np.isnan(x[i]).any():
+            new_y[i,:]=np.nan
+        else:
+            new_y[i,:]=np.interp(new_x,x[i],y[i])
+    return new_y
+
+if numba is not None:
+    _interp_rows=_compile_kernel(_interp_rows,'float64[:,:](float64[:],float64[:,:],float64[:,:])')
+
 def my_interp(x,y,kind='linear'):
     return interpolate.interp1d(x,y,
                                 kind=kind,
@@ -69,6 +198,32 @@ def my_interp(x,y,kind='linear'):
                                 fill_value=(y[np.argmin(x)],
                                             y[np.argmax(x)]))
 
+def interp_weights(x,new_x):
+    """ Indices and weights for linear interpolation from increasing grid x onto new_x
+
+    y(new_x) is then y[...,idx]*(1-w)+y[...,idx+1]*w for any y sampled on x,
+    with the same constant extrapolation past the ends as np.interp
+    """
+    idx=np.clip(np.searchsorted(x,new_x)-1,0,len(x)-2)
+    w=np.clip((new_x-x[idx])/(x[idx+1]-x[idx]),0,1)
+    return idx,w
+
+def psirz_interpolator(psirz,times,psirz_r,psirz_z):
+    """ Build a bilinear (z, r) interpolator over psirz (time, z, r) to evaluate at many points
+
+    The returned function takes r and z arrays of shape (time, channel), or (channel,)
+    for fixed positions, and gives psi at each standard time with the same shape.
+    There's no interpolation in time, so a NaN time slice only affects its own time.
+    Points off the r/z grid take the nearest edge value
+    """
+    def r_z_to_psi(r,z):
+        t,z,r=np.broadcast_arrays(np.arange(len(times))[:,np.newaxis],z,r)
+        ir,wr=interp_weights(psirz_r,np.clip(r,psirz_r[0],psirz_r[-1]))
+        iz,wz=interp_weights(psirz_z,np.clip(z,psirz_z[0],psirz_z[-1]))
+        return (psirz[t,iz,ir]*(1-wz)*(1-wr)+psirz[t,iz,ir+1]*(1-wz)*wr
+                +psirz[t,iz+1,ir]*wz*(1-wr)+psirz[t,iz+1,ir+1]*wz*wr)
+    return r_z_to_psi
+
 def get_volume(r,z,psi_grid,basis,
                fit_psi=True, rho_grid=None):
     efit_psi=np.linspace(0,1,65)
@@ -9,6 +9,10 @@ import h5py
 
 filenames=['big.h5', 'small.h5']
 overwrite_signals=True
+# link shots not yet in the combined file instead of copying them, so combining
+# the per-job outputs only writes metadata; the individual files must then stay
+# next to combined_data.h5 (h5py follows the links transparently on read)
+link_new_shots=False
 
 special_sigs=['times', 'spatial_coordinates']
 with h5py.File('combined_data.h5', 'a') as combined_file:
@@ -21,11 +25,21 @@ with h5py.File('combined_data.h5', 'a') as combined_file:
                 if sig not in combined_file:
                     combined_file[sig]=individ_file[sig][()]
             for shot in shots:
-                if shot not in combined_file:
+                if shot not in combined_file and link_new_shots:
+                    combined_file[shot]=h5py.ExternalLink(filename, shot)
+                elif shot not in combined_file:
                     bytes_shot=bytes(shot, 'utf-8')
                     h5py.h5o.copy(individ_file.id, bytes_shot,
                                   combined_file.id, bytes_shot)
                 else:
+                    link=combined_file.get(shot, getlink=True)
+                    if isinstance(link, h5py.ExternalLink):
+                        # don't merge into a linked file, bring that shot in as a copy first
+                        del combined_file[shot]
+                        bytes_shot=bytes(shot, 'utf-8')
+                        with h5py.File(link.filename, 'r') as linked_file:
+                            h5py.h5o.copy(linked_file.id, bytes_shot,
+                                          combined_file.id, bytes_shot)
                     for sig in individ_file[shot]:
                         if sig not in combined_file[shot]:
                             combined_file[shot][sig]=individ_file[shot][sig][()]